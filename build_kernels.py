@@ -0,0 +1,19 @@
+"""Ahead of time build of the numba kernels into the taxi_kernels extension module,
+models.py imports it when present so no JIT compilation happens at startup
+
+Usage: python build_kernels.py
+"""
+from numba.pycc import CC
+
+import models
+
+cc = CC("taxi_kernels")
+# The module is built for the CPU it is built on, so AVX2/AVX-512 get used if present
+cc.target_cpu = "host"
+
+cc.export("nearest", "UniTuple(i8, 2)(i4[:], i4[:], i4[:], i8[:], i8, i8)")(
+    models._nearest.py_func
+)
+
+if __name__ == "__main__":
+    cc.compile()
\ No newline at end of file
@@ -1,22 +1,29 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import uvicorn
-from models import State
+from models import State, compile_kernels
+from responses import MsgspecResponse
 from routes import router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    compile_kernels()
+    app.state.taxi = State()
+    app.state.taxi.reset()
+    yield
+
+
 app = FastAPI(
     title="Taxi Booking System",
     version="0.0.1",
     contact={"name": "Karthika", "email": "karthikavijay2004@gmail.com"},
+    default_response_class=MsgspecResponse,
+    lifespan=lifespan,
 )
 
-@app.on_event("startup")
-async def startup_event():
-    app.state=State()
-    app.state.reset()
-
 app.include_router(router, prefix="/api")
 
-setattr(app, "state", State())
-
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True)
\ No newline at end of file
@@ -1,12 +1,45 @@
-from typing import Any, List, Optional
+import heapq
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from pydantic import BaseModel, Field
+import msgspec
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    from numba import njit
+
+    HAS_NUMBA = True
+except ImportError:  # numba is optional, the kernels then run as plain Python
+    HAS_NUMBA = False
+
+    def njit(*args: Any, **kwargs: Any) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            return func
+
+        return decorator
+
+
+try:
+    # Native build of _nearest, see build_kernels.py
+    from taxi_kernels import nearest as _nearest_aot
+except ImportError:
+    _nearest_aot = None
 
 
 class EmptyResponse(BaseModel):
     pass
 
 
+# Internal models are msgspec structs, they use __slots__ and are encoded straight
+# to JSON. They only hold scalars, strings and frozen Loc structs so they can never
+# form reference cycles, which makes opting out of the garbage collector
+# (gc=False) safe
+class Loc(msgspec.Struct, frozen=True, gc=False):
+    x: int
+    y: int
+
+
 class Location(BaseModel):
     x: int
     y: int
@@ -14,11 +47,25 @@ class Location(BaseModel):
     def __equals__(self, other: Any) -> bool:
         return self.x == other.x and self.y == other.y
 
+    def to_loc(self) -> Loc:
+        return Loc(self.x, self.y)
 
-class Car(BaseModel):
+
+class Car(msgspec.Struct, gc=False):
+    # Keep the fields in sync with CarSchema, test_schemas.py checks them
     car_id: int
-    name:str
-    location: Location = Location(x=0, y=0)
+    name: str
+    location: Loc = Loc(0, 0)
+    is_booked: bool = False
+    path_location_index: int = -1
+
+
+class CarSchema(BaseModel):
+    """OpenAPI schema of the Car struct"""
+
+    car_id: int
+    name: str
+    location: Location
     is_booked: bool = False
     path_location_index: int = -1
 
@@ -30,7 +77,7 @@ class CarResponse(BaseModel):
 
 
 class CarsResponse(BaseModel):
-    cars: List[Car]
+    cars: List[CarSchema]
 
 
 class BookBase(BaseModel):
@@ -38,9 +85,18 @@ class BookBase(BaseModel):
     destination: Location
 
 
-class Book(BookBase):
+class Book(msgspec.Struct, gc=False):
+    # Keep the fields in sync with BookSchema, test_schemas.py checks them
+    car_id: int
+    source: Loc
+    destination: Loc
+    total_time: int = 0
+
+
+class BookSchema(BookBase):
+    """OpenAPI schema of the Book struct"""
+
     car_id: int
-    path: List[Location] = []
     total_time: int = 0
 
 
@@ -55,32 +111,13 @@ class BookResponse(BaseModel):
 
 
 class StateBase(BaseModel):
-    def calc_total_book_time(
-        self, car: Car, pickup: Location, destination: Location
-    ) -> int:
-        """Calculate the total time to book a car that include the time to get to the pickup location
-        and the time to get to the destination location
-
-        Args:
-            car (Car): Car to book
-            pickup (Location): Pickup location
-            destination (Location): Destination location
-
-        Returns:
-            int: Total time to book a car
-        """
-
-        return self.calc_distance(pickup, car.location) + self.calc_distance(
-            pickup, destination
-        )
-
     @staticmethod
-    def calc_distance(source: Location, destination: Location) -> int:
+    def calc_distance(source: Loc, destination: Loc) -> int:
         """Calculate the distance between two locations using the Manhattan distance
 
         Args:
-            source (Location): Source location
-            destination (Location): Destination location
+            source (Loc): Source location
+            destination (Loc): Destination location
 
         Returns:
             int: Distance between two locations
@@ -89,165 +126,731 @@ class StateBase(BaseModel):
 
     @staticmethod
     def calc_car_path(
-        car_location: Location, pickup: Location, destination: Location
-    ) -> List[Location]:
+        car_location: Loc, pickup: Loc, destination: Loc
+    ) -> np.ndarray:
         """Calculate the path for a car to get to the pickup location and then to the destination location
 
         Args:
-            car_location (Location): Car location
-            pickup (Location): Pickup location
-            destination (Location): Destination location
+            car_location (Loc): Car location
+            pickup (Loc): Pickup location
+            destination (Loc): Destination location
 
         Returns:
-            List[Location]: Path for a car to get to the pickup location and then to the destination location
+            np.ndarray: Path for a car to get to the pickup location and then to the destination location
         """
-        path = StateBase.calc_path(car_location, pickup)
-
-        path_from_pickup_to_destination = StateBase.calc_path(pickup, destination)
-        if len(path_from_pickup_to_destination) > 0:
-            path_from_pickup_to_destination.pop(0)
+        to_pickup = StateBase.calc_distance(car_location, pickup) + 1
+        path = np.empty(
+            (to_pickup + StateBase.calc_distance(pickup, destination), 2), np.int32
+        )
 
-        path.extend(path_from_pickup_to_destination)
+        # Both legs are written in place, the second one starts on the pickup point
+        # that ends the first one
+        StateBase.fill_path(path[:to_pickup], car_location, pickup)
+        StateBase.fill_path(path[to_pickup - 1 :], pickup, destination)
 
         return path
 
     @staticmethod
-    def calc_path(start: Location, end: Location) -> List[Location]:
+    def calc_path(start: Loc, end: Loc) -> np.ndarray:
         """Calculate the path to get to the destination location
 
         Args:
-            start (Location): Start location
-            end (Location): End location
+            start (Loc): Start location
+            end (Loc): End location
 
         Returns:
-            List[Location]: List of Location points to get to the end location
+            np.ndarray: (N, 2) int32 array of x, y points to get to the end location
         """
-        path = []
+        path = np.empty((StateBase.calc_distance(start, end) + 1, 2), np.int32)
+        StateBase.fill_path(path, start, end)
+
+        return path
 
-        dx = abs(end.x - start.x)
+    @staticmethod
+    def fill_path(out: np.ndarray, start: Loc, end: Loc) -> None:
+        """Write the path from start to end into out, moving along y first
+
+        Args:
+            out (np.ndarray): (N, 2) array with one row per point of the path
+            start (Loc): Start location
+            end (Loc): End location
+        """
         dy = abs(end.y - start.y)
+        sign_x = 1 if start.x < end.x else -1
+        sign_y = 1 if start.y < end.y else -1
+
+        out[: dy + 1, 0] = start.x
+        out[: dy + 1, 1] = start.y + np.arange(dy + 1) * sign_y
+        out[dy + 1 :, 0] = start.x + np.arange(1, len(out) - dy) * sign_x
+        out[dy + 1 :, 1] = end.y
+
+
+@njit(cache=True)
+def _nearest(
+    cx: np.ndarray,
+    cy: np.ndarray,
+    car_ids: np.ndarray,
+    slots: np.ndarray,
+    px: int,
+    py: int,
+) -> Tuple[int, int]:
+    """Find the free car with the smallest (distance, car_id) key, only the cars
+    at the given slots are scanned
+
+    Returns:
+        Tuple[int, int]: Index of the nearest free car and its distance, or (-1, -1)
+    """
+    nearest_index = -1
+    nearest_distance = -1
+    for i in slots:
+        distance = abs(cx[i] - px) + abs(cy[i] - py)
+        if (
+            nearest_index == -1
+            or distance < nearest_distance
+            or (distance == nearest_distance and car_ids[i] < car_ids[nearest_index])
+        ):
+            nearest_index = i
+            nearest_distance = distance
+
+    return nearest_index, nearest_distance
+
+
+def _nearest_bulk(
+    cx: np.ndarray,
+    cy: np.ndarray,
+    car_ids: np.ndarray,
+    slots: np.ndarray,
+    px: int,
+    py: int,
+) -> Tuple[int, int]:
+    """Vectorized version of _nearest used when numba is not installed
+
+    Returns:
+        Tuple[int, int]: Index of the nearest free car and its distance, or (-1, -1)
+    """
+    if len(slots) == 0:
+        return -1, -1
+
+    # Subtract in int64, int32 coordinates at opposite ends would overflow, and
+    # reuse the buffers so np.abs runs in place
+    distances = np.subtract(cx[slots], px, dtype=np.int64)
+    dy = np.subtract(cy[slots], py, dtype=np.int64)
+    np.abs(distances, out=distances)
+    np.abs(dy, out=dy)
+    distances += dy
+
+    nearest_distance = int(distances.min())
+    candidates = slots[distances == nearest_distance]
+    nearest_index = int(candidates[np.argmin(car_ids[candidates])])
+
+    return nearest_index, nearest_distance
+
+
+# Coordinates are shifted by 2**31 so that int32 values map to unsigned z-order keys
+ZORDER_BIAS = 1 << 31
+
+# Bits of the x coordinate in a z-order key, the y bits are the odd ones
+ZORDER_EVEN_BITS = 0x5555555555555555
+
+# Keys tested at once by ZOrderIndex.in_box, doubled after every chunk that is
+# not followed by a BIGMIN jump
+ZORDER_SCAN_CHUNK = 256
+
+# Cost of a chunk and of a BIGMIN jump of ZOrderIndex.in_box, in keys tested
+ZORDER_STEP_COST = 1024
+ZORDER_JUMP_COST = 2048
+
+# A key tested by ZOrderIndex.in_box takes about as long as this many cars of a
+# plain scan, the z-order search gives up once it costs as much as the scan
+ZORDER_KEY_COST = 4
+
+# Smallest number of free cars whose budget pays for the first box and one chunk
+# of keys, below it the z-order search always gives up and is not tried
+ZORDER_MIN_FREE_CARS = ZORDER_KEY_COST * (2 * ZORDER_STEP_COST + ZORDER_SCAN_CHUNK)
+
+# Above this number of free cars book_cars books the trips one by one instead of
+# building a (free cars x trips) distance matrix
+BOOK_BATCH_MAX_FREE_CARS = 512
+
+
+def _spread_bits(v: Any) -> Any:
+    """Spread the low 32 bits of v to the even bits of a 64 bit value, works on ints
+    and uint64 arrays"""
+    v = v & 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & ZORDER_EVEN_BITS
+    return v
+
+
+def zorder(x: int, y: int) -> int:
+    """Interleave the bits of x and y into a single z-order (Morton) key"""
+    return _spread_bits(x + ZORDER_BIAS) | (_spread_bits(y + ZORDER_BIAS) << 1)
+
+
+def zorder_keys(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Vectorized zorder for int32 coordinate arrays"""
+    ux = (xs.astype(np.int64) + ZORDER_BIAS).astype(np.uint64)
+    uy = (ys.astype(np.int64) + ZORDER_BIAS).astype(np.uint64)
+    return _spread_bits(ux) | (_spread_bits(uy) << 1)
+
+
+def _bigmin(zval: int, zmin: int, zmax: int) -> int:
+    """Find the smallest z-order key inside the box spanned by zmin and zmax that is
+    greater than zval, zval must be a key outside of the box (BIGMIN from Tropf and
+    Herzog, "Multidimensional Range Search in Dynamically Balanced Trees")
+
+    Args:
+        zval (int): Key outside of the box with zmin < zval < zmax
+        zmin (int): Key of the lower left corner of the box
+        zmax (int): Key of the upper right corner of the box
+
+    Returns:
+        int: Next key inside of the box
+    """
+    bigmin = zmax
+    for bit in range(63, -1, -1):
+        mask = 1 << bit
+        # Lower bits that belong to the same coordinate as this bit
+        lower = (ZORDER_EVEN_BITS << (bit & 1)) & (mask - 1)
+
+        if not zval & mask:
+            if not zmin & mask and zmax & mask:
+                bigmin = (zmin & ~lower) | mask
+                zmax = (zmax & ~mask) | lower
+            elif zmin & mask:
+                return zmin
+        elif not zmin & mask:
+            if not zmax & mask:
+                return bigmin
+            zmin = (zmin & ~lower) | mask
+
+    return bigmin
+
+
+class ZOrderIndex:
+    """Free cars sorted by the z-order key of their location. Cars close to each
+    other have close keys, so the cars inside a box are found with binary searches
+    instead of a scan over the whole fleet"""
+
+    def __init__(self) -> None:
+        self.keys = np.empty(0, np.uint64)
+        self.slots = np.empty(0, np.int32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def insert(self, xs: np.ndarray, ys: np.ndarray, slots: np.ndarray) -> None:
+        keys = zorder_keys(xs, ys)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+
+        positions = np.searchsorted(self.keys, keys)
+        self.keys = np.insert(self.keys, positions, keys)
+        self.slots = np.insert(self.slots, positions, slots[order])
+
+    def remove(self, x: int, y: int, slot: int) -> None:
+        key = np.uint64(zorder(x, y))
+        start = int(np.searchsorted(self.keys, key, "left"))
+        end = int(np.searchsorted(self.keys, key, "right"))
+
+        position = start + int(np.flatnonzero(self.slots[start:end] == slot)[0])
+        self.keys = np.delete(self.keys, position)
+        self.slots = np.delete(self.slots, position)
+
+    def in_box(
+        self,
+        cx: np.ndarray,
+        cy: np.ndarray,
+        x0: int,
+        y0: int,
+        x1: int,
+        y1: int,
+        budget: int,
+    ) -> Tuple[Optional[np.ndarray], int]:
+        """Find the slots of the cars inside the box. The keys between the box
+        corners are tested in chunks, and when a chunk ends outside of the box the
+        keys up to the next one inside are skipped with a BIGMIN jump
 
-        for i in range(dy + 1):
-            if start.y < end.y:
-                path.append(Location(x=start.x, y=start.y + i))
-            else:
-                path.append(Location(x=start.x, y=start.y - i))
+        Args:
+            budget (int): Number of keys that may still be tested, a chunk or a
+                jump also costs ZORDER_STEP_COST or ZORDER_JUMP_COST keys
+
+        Returns:
+            Tuple[Optional[np.ndarray], int]: Slots of the cars inside the box, or
+            None when the budget runs out, and the budget left
+        """
+        zmin = zorder(x0, y0)
+        zmax = zorder(x1, y1)
+        found = []
+
+        i = int(np.searchsorted(self.keys, np.uint64(zmin), "left"))
+        end = int(np.searchsorted(self.keys, np.uint64(zmax), "right"))
+        budget -= ZORDER_STEP_COST
+        chunk = ZORDER_SCAN_CHUNK
+        while budget >= 0 and i < end:
+            chunk_end = min(i + chunk, end)
+            budget -= chunk_end - i + ZORDER_STEP_COST
+            if budget < 0:
+                break
 
-        for i in range(1, dx + 1):
-            if start.x < end.x:
-                path.append(Location(x=start.x + i, y=end.y))
+            slots = self.slots[i:chunk_end]
+            xs = cx[slots]
+            ys = cy[slots]
+            inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+            found.append(slots[inside])
+
+            i = chunk_end
+            if i < end and not inside[-1]:
+                budget -= ZORDER_JUMP_COST
+                next_key = np.uint64(_bigmin(int(self.keys[i - 1]), zmin, zmax))
+                i = max(i, int(np.searchsorted(self.keys, next_key, "left")))
+                chunk = ZORDER_SCAN_CHUNK
             else:
-                path.append(Location(x=start.x - i, y=end.y))
+                chunk *= 2
+
+        if budget < 0:
+            return None, budget
+
+        slots = np.concatenate(found) if found else np.empty(0, np.int32)
+        return slots, budget
+
+    def nearest(
+        self,
+        cx: np.ndarray,
+        cy: np.ndarray,
+        car_ids: np.ndarray,
+        px: int,
+        py: int,
+        budget: Optional[int] = None,
+    ) -> Optional[Tuple[int, int]]:
+        """Find the nearest car by searching boxes of growing radius around the
+        pickup location, with the same (distance, car_id) order as _nearest
 
-        return path
+        Args:
+            budget (Optional[int]): Number of keys the search may test, defaults to
+                the cost of a plain scan over the cars
+
+        Returns:
+            Optional[Tuple[int, int]]: Index of the nearest free car and its
+            distance, or (-1, -1) when there are no cars. None when the boxes span
+            so many keys outside of them that a plain scan is faster
+        """
+        if not len(self):
+            return -1, -1
+
+        low, high = -ZORDER_BIAS, ZORDER_BIAS - 1
+        if budget is None:
+            budget = len(self) // ZORDER_KEY_COST
+        radius = 1
+        while True:
+            slots, budget = self.in_box(
+                cx,
+                cy,
+                max(px - radius, low),
+                max(py - radius, low),
+                min(px + radius, high),
+                min(py + radius, high),
+                budget,
+            )
+            if slots is None:
+                return None
+
+            if not len(slots):
+                radius *= 2
+                continue
+
+            # Every car within `distance` lies in the box of that radius, so the
+            # nearest car found is final once it is not farther than the radius
+            slot, distance = _nearest_bulk(cx, cy, car_ids, slots, px, py)
+            if distance <= radius:
+                return slot, distance
+
+            radius = distance
+
+
+# Initial number of rows of the shared path arena
+PATH_ARENA_MIN_SIZE = 1024
+
+
+# Prefer the ahead of time build, then the numba JIT, then the NumPy version
+if _nearest_aot is not None:
+    _nearest_kernel = _nearest_aot
+elif HAS_NUMBA:
+    _nearest_kernel = _nearest
+else:
+    _nearest_kernel = _nearest_bulk
+
+
+def compile_kernels() -> None:
+    """Call the kernels once with dummy arguments so numba compiles them at startup
+    instead of on the first booking, this is a no-op for the ahead of time build"""
+    if _nearest_aot is not None:
+        return
+
+    empty = np.zeros(1, np.int32)
+    _nearest_kernel(empty, empty, empty, np.zeros(1, np.int64), 0, 0)
 
 
 class State(StateBase):
-    cars: List[Car] = []
-    bookings: List[Book] = []
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     current_time: int = 0
 
-    def __init__(self, **data: Any) -> None:
+    # Booked cars only move along their path when read, so the list of all cars
+    # is private and the cars property moves them before handing it out
+    _cars: List[Car]
+
+    # car_id -> index of the car in self._cars and car_id -> active booking
+    _car_index: Dict[int, int]
+    _book_index: Dict[int, Book]
+
+    # Car positions and availability mirrored by index of self._cars for _nearest
+    _cx: np.ndarray
+    _cy: np.ndarray
+    _free: np.ndarray
+    _car_ids: np.ndarray
+
+    # Free cars by z-order key, only kept while there are enough free cars for
+    # _find_nearest_slot to use it
+    _zindex: Optional[ZOrderIndex]
+
+    # Free and booked cars with their indexes, both kept in the order of self._cars
+    _free_slots: List[int]
+    _free_cars: List[Car]
+    _booked_slots: List[int]
+    _booked_cars: List[Car]
+
+    # Booking of each booked car by index of self._cars, it started at time
+    # _book_start and its path is stored at _path_arena[offset:offset + len]
+    _book_start: np.ndarray
+    _book_len: np.ndarray
+    _book_offset: np.ndarray
+
+    # Min-heap of (completion time, car index) of the active bookings
+    _completions: List[Tuple[int, int]]
+
+    # Paths of all bookings back to back, rows up to _path_end are in use
+    _path_arena: np.ndarray
+    _path_end: int
+
+    def __init__(self, cars: Optional[List[Car]] = None, **data: Any) -> None:
         super().__init__(**data)
+        self._cars = list(cars) if cars else []
+        self._index_cars()
+        self._clear_bookings()
+
+    def _index_cars(self) -> None:
+        self._car_index = {car.car_id: i for i, car in enumerate(self._cars)}
+        self._cx = np.array([car.location.x for car in self._cars], np.int32)
+        self._cy = np.array([car.location.y for car in self._cars], np.int32)
+        self._free = np.array([not car.is_booked for car in self._cars], bool)
+        self._car_ids = np.array([car.car_id for car in self._cars], np.int32)
+
+        self._free_slots = [i for i, car in enumerate(self._cars) if not car.is_booked]
+        self._free_cars = [self._cars[i] for i in self._free_slots]
+        self._booked_slots = [i for i, car in enumerate(self._cars) if car.is_booked]
+        self._booked_cars = [self._cars[i] for i in self._booked_slots]
+
+        self._zindex = None
+        self._update_zindex()
+
+    def _update_zindex(self) -> None:
+        """Build the z-order index once there are ZORDER_MIN_FREE_CARS free cars and
+        drop it once there are less than half of that, so a fleet going back and
+        forth around the threshold does not rebuild it on every booking"""
+        free_cars = len(self._free_slots)
+        if self._zindex is None and free_cars >= ZORDER_MIN_FREE_CARS:
+            free_slots = np.flatnonzero(self._free)
+            self._zindex = ZOrderIndex()
+            self._zindex.insert(self._cx[free_slots], self._cy[free_slots], free_slots)
+        elif self._zindex is not None and free_cars < ZORDER_MIN_FREE_CARS // 2:
+            self._zindex = None
+
+    def _set_booked(self, slot: int, is_booked: bool) -> None:
+        """Mark a car as booked or free and move it to the matching car list"""
+        car = self._cars[slot]
+        car.is_booked = is_booked
+        self._free[slot] = not is_booked
+
+        if is_booked:
+            source_slots, source_cars = self._free_slots, self._free_cars
+            target_slots, target_cars = self._booked_slots, self._booked_cars
+        else:
+            source_slots, source_cars = self._booked_slots, self._booked_cars
+            target_slots, target_cars = self._free_slots, self._free_cars
+
+        position = bisect_left(source_slots, slot)
+        del source_slots[position]
+        del source_cars[position]
+
+        position = bisect_left(target_slots, slot)
+        target_slots.insert(position, slot)
+        target_cars.insert(position, car)
+
+    def _find_nearest_slot(self, pickup: Loc) -> int:
+        if self._zindex is not None and len(self._zindex) >= ZORDER_MIN_FREE_CARS:
+            nearest = self._zindex.nearest(
+                self._cx, self._cy, self._car_ids, pickup.x, pickup.y
+            )
+            if nearest is not None:
+                return nearest[0]
+
+        # Small fleets, or a z-order search that gave up, scan all the free cars
+        slot, _ = _nearest_kernel(
+            self._cx,
+            self._cy,
+            self._car_ids,
+            np.flatnonzero(self._free),
+            pickup.x,
+            pickup.y,
+        )
+
+        return slot
+
+    def _clear_bookings(self) -> None:
+        self._book_index = {}
+        self._book_start = np.zeros(len(self._cars), np.int64)
+        self._book_len = np.zeros(len(self._cars), np.int32)
+        self._book_offset = np.zeros(len(self._cars), np.int32)
+        self._completions = []
+        self._path_arena = np.empty((PATH_ARENA_MIN_SIZE, 2), np.int32)
+        self._path_end = 0
+
+    def _store_path(self, path: np.ndarray) -> int:
+        """Copy a path at the end of the path arena, the arena is compacted and grown
+        when it is full
+
+        Args:
+            path (np.ndarray): Path to store
+
+        Returns:
+            int: Offset of the path in the arena
+        """
+        if self._path_end + len(path) > len(self._path_arena):
+            self._compact_paths(extra=len(path))
+
+        offset = self._path_end
+        self._path_end += len(path)
+        self._path_arena[offset : self._path_end] = path
+
+        return offset
+
+    def _compact_paths(self, extra: int = 0) -> None:
+        """Move the paths of active bookings to the start of a new arena with room
+        for at least `extra` more rows"""
+        slots = np.flatnonzero(~self._free)
+        lengths = self._book_len[slots]
+        used = int(lengths.sum())
+        size = max(PATH_ARENA_MIN_SIZE, 2 * (used + extra))
+        arena = np.empty((size, 2), np.int32)
+
+        offsets = np.zeros_like(lengths)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        for old, new, length in zip(
+            self._book_offset[slots].tolist(), offsets.tolist(), lengths.tolist()
+        ):
+            arena[new : new + length] = self._path_arena[old : old + length]
+
+        self._path_arena = arena
+        self._path_end = used
+        self._book_offset[slots] = offsets
+
+    def _move_booked_cars(self, slots: np.ndarray) -> None:
+        """Move the booked cars at the given slots to their location at the current
+        time, a car stays on the last point of its path until the booking completes"""
+        indexes = np.minimum(
+            self.current_time - self._book_start[slots], self._book_len[slots] - 1
+        )
+        locations = self._path_arena[self._book_offset[slots] + indexes]
+
+        for slot, index, (x, y) in zip(
+            slots.tolist(), indexes.tolist(), locations.tolist()
+        ):
+            car = self._cars[slot]
+            car.path_location_index = index
+            car.location = Loc(x, y)
+
+    @property
+    def cars(self) -> List[Car]:
+        """All the cars, the booked ones moved to their location at the current time"""
+        self._move_booked_cars(np.array(self._booked_slots, np.int32))
+
+        return self._cars
+
+    @property
+    def bookings(self) -> List[Book]:
+        return list(self._book_index.values())
+
+    def list_cars(self, is_booked: bool) -> List[Car]:
+        if not is_booked:
+            return self._free_cars
+
+        self._move_booked_cars(np.array(self._booked_slots, np.int32))
+
+        return self._booked_cars
 
     def get_car(self, car_id: int) -> Optional[Car]:
-        found = None
-        for car in self.cars:
-            if car.car_id == car_id:
-                found = car
-                break
+        slot = self._car_index.get(car_id)
+        if slot is None:
+            return None
+
+        if not self._free[slot]:
+            self._move_booked_cars(np.array([slot]))
 
-        return found
+        return self._cars[slot]
 
     def get_booking(self, car_id: int) -> Book:
-        return next(b for b in self.bookings if b.car_id == car_id)
+        return self._book_index[car_id]
 
     def reset(self) -> None:
-        self.cars = [
+        self._cars = [
             Car(car_id=1, name="Toyota Prius"),
             Car(car_id=2, name="Honda Civic"),
             Car(car_id=3, name="Ford Mustang"),
             ]
-        self.bookings = []
         self.current_time = 0
+        self._index_cars()
+        self._clear_bookings()
 
     def increment_time(self) -> None:
         self.current_time += 1
 
-        for index, book in enumerate(self.bookings):
-            car = self.get_car(book.car_id)
-
-            # Move car to next location
-            if car:
-                car.path_location_index += 1
-                car.location = book.path[car.path_location_index]
-
-                # Check if car arrived to destination
-                if car.path_location_index == len(book.path) - 1:
-                    car.is_booked = False
-                    car.path_location_index = -1
-                    self.bookings.pop(index)
-
-    def book_car(self, pickup: Location, destination: Location) -> Optional[Book]:
+        # Only the bookings completing now need work, the cars on their way are
+        # moved when they are read
+        done = []
+        while self._completions and self._completions[0][0] <= self.current_time:
+            done.append(heapq.heappop(self._completions)[1])
+
+        if not done:
+            return
+
+        done_slots = np.array(done, np.int32)
+        self._move_booked_cars(done_slots)
+        for slot in done:
+            car = self._cars[slot]
+            car.path_location_index = -1
+            self._cx[slot], self._cy[slot] = car.location.x, car.location.y
+            self._set_booked(slot, False)
+            del self._book_index[car.car_id]
+
+        if self._zindex is not None:
+            self._zindex.insert(self._cx[done_slots], self._cy[done_slots], done_slots)
+        else:
+            self._update_zindex()
+
+        # Start filling the arena from the beginning again once it is unused
+        if not self._book_index:
+            self._path_end = 0
+
+    def book_car(self, pickup: Loc, destination: Loc) -> Optional[Book]:
         """Book car method to create new booking if there is available car
 
         Args:
-            pickup (Location): Pick up location
-            destination (Location): Destination location
+            pickup (Loc): Pick up location
+            destination (Loc): Destination location
 
         Returns:
             Optional[Book]: Created book object or None
         """
-        nearest_car = self.find_nearest_available_car(pickup=pickup)
-        if not nearest_car:
+        slot = self._find_nearest_slot(pickup)
+        if slot == -1:
             return None
 
-        nearest_car.is_booked = True
+        return self._book_slot(slot, pickup, destination)
+
+    def book_cars(self, trips: List[Tuple[Loc, Loc]]) -> List[Optional[Book]]:
+        """Book cars for several (pickup, destination) trips at once, the trips get
+        the same cars as booking them one by one with book_car
+
+        Args:
+            trips (List[Tuple[Loc, Loc]]): Pick up and destination locations
+
+        Returns:
+            List[Optional[Book]]: Created book object or None for each trip
+        """
+        slots = np.flatnonzero(self._free)
+
+        # The distance matrix grows with the number of free cars, large fleets
+        # book the trips one by one
+        if len(slots) > BOOK_BATCH_MAX_FREE_CARS:
+            return [self.book_car(pickup, destination) for pickup, destination in trips]
+
+        # Every trip takes a car, so the trips past the number of free cars get none
+        served = trips[: len(slots)]
+        px = np.fromiter((pickup.x for pickup, _ in served), np.int64, len(served))
+        py = np.fromiter((pickup.y for pickup, _ in served), np.int64, len(served))
+
+        # Distance of every free car (rows) to every pickup location (columns)
+        distances = np.abs(self._cx[slots, None] - px[None, :]) + np.abs(
+            self._cy[slots, None] - py[None, :]
+        )
+        booked = np.iinfo(np.int64).max
+
+        books: List[Optional[Book]] = []
+        for column, (pickup, destination) in zip(distances.T, served):
+            candidates = np.flatnonzero(column == column.min())
+            row = candidates[np.argmin(self._car_ids[slots[candidates]])]
+            distances[row, :] = booked
+
+            books.append(self._book_slot(int(slots[row]), pickup, destination))
+
+        books.extend(None for _ in trips[len(served) :])
+
+        return books
+
+    def _book_slot(self, slot: int, pickup: Loc, destination: Loc) -> Book:
+        nearest_car = self._cars[slot]
+
+        # The path holds every point the car goes through, one per time unit
+        path = self.calc_car_path(nearest_car.location, pickup, destination)
+        self._book_offset[slot] = self._store_path(path)
+        self._book_len[slot] = len(path)
+        self._book_start[slot] = self.current_time
+
+        # A booking ends once the car reaches its last point, but never in the
+        # same time unit it was created
+        heapq.heappush(
+            self._completions, (self.current_time + max(len(path) - 1, 1), slot)
+        )
+
         nearest_car.path_location_index = 0
+        self._set_booked(slot, True)
+        if self._zindex is not None:
+            self._zindex.remove(nearest_car.location.x, nearest_car.location.y, slot)
+            self._update_zindex()
 
         book = Book(
             car_id=nearest_car.car_id,
             source=pickup,
             destination=destination,
-            total_time=self.calc_total_book_time(nearest_car, pickup, destination),
-            path=self.calc_car_path(nearest_car.location, pickup, destination),
+            total_time=path.shape[0] - 1,
         )
-        self.bookings.append(book)
+        self._book_index[book.car_id] = book
 
         return book
 
-    def find_nearest_available_car(self, pickup: Location) -> Optional[Car]:
+    def find_nearest_available_car(self, pickup: Loc) -> Optional[Car]:
         """Find nearest available car to the pickup location.
         If no car is available, return None.
         If multiple cars are available, return the one with the smallest id.
 
         Args:
-            pickup (Location): Pick up location
+            pickup (Loc): Pick up location
 
         Returns:
             Optional[Car]: Nearest available car
         """
-        nearest_car = None
-        nearest_distance = float("inf")
-        for car in self.cars:
-            if not car.is_booked:
-                distance = self.calc_distance(pickup, car.location)
-                if distance < nearest_distance:
-                    nearest_distance = distance
-                    nearest_car = car
-
-                if distance == nearest_distance:
-                    nearest_distance = distance
-
-                    if car.car_id < nearest_car.car_id:
-                        nearest_car = car
+        slot = self._find_nearest_slot(pickup)
 
-        return nearest_car
+        return self._cars[slot] if slot != -1 else None
 
 
 class ResetResponse(BaseModel):
     current_time: int
-    bookings: List[Book] = []
+    bookings: List[BookSchema] = []
 
 
 class TickResponse(BaseModel):
@@ -0,0 +1,12 @@
+from typing import Any
+
+import msgspec
+from fastapi.responses import JSONResponse
+
+
+class MsgspecResponse(JSONResponse):
+    """JSON response encoded with msgspec, it encodes the msgspec structs of
+    models.py directly as well as plain JSON data"""
+
+    def render(self, content: Any) -> bytes:
+        return msgspec.json.encode(content)
\ No newline at end of file
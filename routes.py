@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from fastapi import APIRouter, Query, Request, Response, status
 
 from models import (
@@ -8,11 +10,12 @@ from models import (
     ResetResponse,
     TickResponse,
 )
+from responses import MsgspecResponse
 
 router = APIRouter()
 
 
-@router.get("/cars", response_model=CarsResponse)
+@router.get("/cars", response_model=None, responses={200: {"model": CarsResponse}})
 async def list_cars(
     request: Request,
     is_booked: bool = Query(
@@ -20,11 +23,8 @@ async def list_cars(
     ),
 ):
     """Method to list cars in the system"""
-    cars = []
-    for car in request.app.state.cars:
-        if car.is_booked == is_booked:
-            cars.append(car)
-    return {"cars": cars}
+    state = request.app.state.taxi
+    return MsgspecResponse({"cars": state.list_cars(is_booked)})
 
 
 @router.get(
@@ -32,7 +32,8 @@ async def list_cars(
 )
 async def get_car(car_id: int, request: Request):
     """Method to retrieve a car by id"""
-    car = request.app.state.get_car(car_id)
+    state = request.app.state.taxi
+    car = state.get_car(car_id)
     if not car:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -42,31 +43,66 @@ async def get_car(car_id: int, request: Request):
 @router.post(
     "/book",
     status_code=status.HTTP_201_CREATED,
-    response_model=BookResponse,
-    responses={204: {"model": "", "description": "No avaialable cars for booking"}},
+    response_model=None,
+    responses={
+        201: {"model": BookResponse},
+        204: {"model": "", "description": "No avaialable cars for booking"},
+    },
 )
 async def create_book(book_request: BookRequest, request: Request):
     """Method to create new booking"""
-    book = request.app.state.book_car(
-        pickup=book_request.source, destination=book_request.destination
+    state = request.app.state.taxi
+    book = state.book_car(
+        pickup=book_request.source.to_loc(),
+        destination=book_request.destination.to_loc(),
     )
     if not book:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    return book
+    return {"car_id": book.car_id, "total_time": book.total_time}
+
+
+@router.post(
+    "/book_batch",
+    status_code=status.HTTP_201_CREATED,
+    response_model=None,
+    responses={
+        201: {
+            "model": List[Optional[BookResponse]],
+            "description": "Booking for each request, null if no car was available",
+        }
+    },
+)
+async def create_books(book_requests: List[BookRequest], request: Request):
+    """Method to create several bookings at once, in the order of the requests"""
+    state = request.app.state.taxi
+    books = state.book_cars(
+        [
+            (book_request.source.to_loc(), book_request.destination.to_loc())
+            for book_request in book_requests
+        ]
+    )
+
+    return [
+        {"car_id": book.car_id, "total_time": book.total_time} if book else None
+        for book in books
+    ]
 
 
-@router.post("/tick", response_model=TickResponse)
+@router.post("/tick", response_model=None, responses={200: {"model": TickResponse}})
 async def tick(request: Request):
     """Method to increment system time"""
-    request.app.state.increment_time()
+    state = request.app.state.taxi
+    state.increment_time()
 
-    return request.app.state
+    return {"current_time": state.current_time}
 
 
-@router.put("/reset", response_model=ResetResponse)
+@router.put("/reset", response_model=None, responses={200: {"model": ResetResponse}})
 async def reset(request: Request):
     """Method to reset system's state"""
-    request.app.state.reset()
+    state = request.app.state.taxi
+    state.reset()
 
-    return request.app.state
\ No newline at end of file
+    # A reset state never has bookings, no need to serialize the whole State
+    return {"current_time": state.current_time, "bookings": []}
\ No newline at end of file
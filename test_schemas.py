@@ -0,0 +1,17 @@
+import msgspec
+import pytest
+
+from models import Book, BookSchema, Car, CarSchema, Loc, Location
+
+
+@pytest.mark.parametrize("struct, schema", [(Car, CarSchema), (Book, BookSchema)])
+def test_schema_matches_struct(struct, schema):
+    # The schemas only document the structs in OpenAPI, with Location for Loc
+    struct_fields = {
+        field.name: Location if field.type is Loc else field.type
+        for field in msgspec.structs.fields(struct)
+    }
+    schema_fields = {
+        name: field.annotation for name, field in schema.model_fields.items()
+    }
+    assert schema_fields == struct_fields
\ No newline at end of file
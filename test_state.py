@@ -0,0 +1,176 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from models import BOOK_BATCH_MAX_FREE_CARS, Car, Loc, State
+
+
+def make_cars(rnd, n, spread):
+    return [
+        Car(
+            car_id=i + 1,
+            name=str(i),
+            location=Loc(rnd.randint(-spread, spread), rnd.randint(-spread, spread)),
+        )
+        for i in range(n)
+    ]
+
+
+def random_trips(rnd, n, spread):
+    return [
+        (
+            Loc(rnd.randint(-spread, spread), rnd.randint(-spread, spread)),
+            Loc(rnd.randint(-spread, spread), rnd.randint(-spread, spread)),
+        )
+        for _ in range(n)
+    ]
+
+
+def summary(books):
+    return [None if book is None else (book.car_id, book.total_time) for book in books]
+
+
+# A small spread puts many cars at the same distance of a pickup, so the
+# car_id tie-break decides most bookings
+@pytest.mark.parametrize("n", [0, 1, 3, 20, BOOK_BATCH_MAX_FREE_CARS + 1])
+@pytest.mark.parametrize("spread", [2, 50])
+def test_book_cars_matches_book_car(n, spread):
+    rnd = random.Random(n * 100 + spread)
+    seed = rnd.random()
+    batched = State(cars=make_cars(random.Random(seed), n, spread))
+    single = State(cars=make_cars(random.Random(seed), n, spread))
+
+    for _ in range(20):
+        trips = random_trips(rnd, rnd.randint(0, n + 3), spread)
+        books = batched.book_cars(trips)
+        assert len(books) == len(trips)
+        assert summary(books) == summary(
+            [single.book_car(pickup, destination) for pickup, destination in trips]
+        )
+
+        for _ in range(rnd.randint(0, 3 * spread)):
+            batched.increment_time()
+            single.increment_time()
+
+
+def test_book_cars_more_trips_than_free_cars():
+    state = State(cars=make_cars(random.Random(0), 3, 5))
+    trips = random_trips(random.Random(1), 5, 5)
+
+    books = state.book_cars(trips)
+    assert [book is None for book in books] == [False, False, False, True, True]
+    assert sorted(book.car_id for book in books[:3]) == [1, 2, 3]
+    assert state.book_cars(trips) == [None] * 5
+
+
+def test_book_cars_empty_batch():
+    state = State(cars=make_cars(random.Random(0), 3, 5))
+
+    assert state.book_cars([]) == []
+    assert state.list_cars(is_booked=True) == []
+
+
+def reference_path(start, end):
+    """Baseline path, y first then x, one point per time unit"""
+    (x0, y0), (x1, y1) = start, end
+    sign_x = 1 if x0 < x1 else -1
+    sign_y = 1 if y0 < y1 else -1
+    path = [(x0, y0 + i * sign_y) for i in range(abs(y1 - y0) + 1)]
+    path += [(x0 + i * sign_x, y1) for i in range(1, abs(x1 - x0) + 1)]
+    return path
+
+
+class ReferenceFleet:
+    """Baseline simulation, every booked car moves one point along its path on
+    every tick"""
+
+    def __init__(self, car_ids):
+        self.cars = {
+            car_id: {"location": (0, 0), "path": None, "index": -1}
+            for car_id in car_ids
+        }
+
+    def book(self, pickup, destination):
+        free = [car_id for car_id, car in self.cars.items() if car["path"] is None]
+        if not free:
+            return None
+
+        def key(car_id):
+            x, y = self.cars[car_id]["location"]
+            return abs(x - pickup[0]) + abs(y - pickup[1]), car_id
+
+        car_id = min(free, key=key)
+        car = self.cars[car_id]
+        path = reference_path(car["location"], pickup)
+        path += reference_path(pickup, destination)[1:]
+        car["path"], car["index"] = path, 0
+        return {"car_id": car_id, "total_time": len(path) - 1}
+
+    def tick(self):
+        for car in self.cars.values():
+            if car["path"] is None:
+                continue
+
+            car["index"] = min(car["index"] + 1, len(car["path"]) - 1)
+            car["location"] = car["path"][car["index"]]
+            if car["index"] == len(car["path"]) - 1:
+                car["path"], car["index"] = None, -1
+
+    def listed(self, is_booked):
+        return [
+            (car_id, car["location"], car["index"])
+            for car_id, car in sorted(self.cars.items())
+            if (car["path"] is not None) == is_booked
+        ]
+
+
+def listed(client, is_booked):
+    response = client.get("/api/cars", params={"is_booked": is_booked})
+    assert response.status_code == 200
+    return [
+        (
+            car["car_id"],
+            (car["location"]["x"], car["location"]["y"]),
+            car["path_location_index"],
+        )
+        for car in response.json()["cars"]
+    ]
+
+
+def test_tick_moves_booked_cars_step_by_step():
+    rnd = random.Random(0)
+    with TestClient(app) as client:
+        client.put("/api/reset")
+        reference = ReferenceFleet([1, 2, 3])
+
+        for _ in range(200):
+            action = rnd.random()
+            trips = [
+                [(rnd.randint(-6, 6), rnd.randint(-6, 6)) for _ in range(2)]
+                for _ in range(rnd.randint(0, 4))
+            ]
+            bodies = [
+                {
+                    "source": {"x": pickup[0], "y": pickup[1]},
+                    "destination": {"x": destination[0], "y": destination[1]},
+                }
+                for pickup, destination in trips
+            ]
+            if action < 0.2 and trips:
+                response = client.post("/api/book", json=bodies[0])
+                expected = reference.book(*trips[0])
+                assert response.status_code == (204 if expected is None else 201)
+                if expected is not None:
+                    assert response.json() == expected
+            elif action < 0.3:
+                response = client.post("/api/book_batch", json=bodies)
+                assert response.status_code == 201
+                assert response.json() == [reference.book(*trip) for trip in trips]
+            else:
+                client.post("/api/tick")
+                reference.tick()
+
+            assert listed(client, True) == reference.listed(True)
+            assert listed(client, False) == reference.listed(False)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import random
+
+import numpy as np
+import pytest
+
+import models
+from models import (
+    ZORDER_MIN_FREE_CARS,
+    Car,
+    Loc,
+    State,
+    ZOrderIndex,
+    _bigmin,
+    _nearest_bulk,
+    zorder,
+    zorder_keys,
+)
+
+INT32_MIN, INT32_MAX = -(1 << 31), (1 << 31) - 1
+
+
+def uniform(rng, n):
+    return rng.integers(-1000, 1000, n), rng.integers(-1000, 1000, n)
+
+
+def clustered(rng, n):
+    return rng.integers(1000, 1300, n), rng.integers(1000, 1300, n)
+
+
+def far_cluster(rng, n):
+    return rng.integers(10**6, 10**6 + 300, n), rng.integers(
+        -(10**6) - 300, -(10**6), n
+    )
+
+
+def int32_boundary(rng, n):
+    edges = np.array([INT32_MIN, INT32_MIN + 1, -1, 0, 1, INT32_MAX - 1, INT32_MAX])
+    return rng.choice(edges, n), rng.choice(edges, n)
+
+
+def full_range(rng, n):
+    return rng.integers(INT32_MIN, INT32_MAX, n, endpoint=True), rng.integers(
+        INT32_MIN, INT32_MAX, n, endpoint=True
+    )
+
+
+@pytest.mark.parametrize(
+    "layout", [uniform, clustered, far_cluster, int32_boundary, full_range]
+)
+@pytest.mark.parametrize("n", [1, 50, 2000])
+def test_nearest_matches_plain_scan(layout, n):
+    rng = np.random.default_rng(n)
+    xs, ys = layout(rng, n)
+    cx = xs.astype(np.int32)
+    cy = ys.astype(np.int32)
+    # Shuffled ids so ties are not broken by slot order
+    car_ids = rng.permutation(n).astype(np.int32) + 1
+    slots = np.arange(n, dtype=np.int32)
+
+    index = ZOrderIndex()
+    index.insert(cx, cy, slots)
+
+    pickups = [(0, 0), (INT32_MIN, INT32_MIN), (INT32_MAX, INT32_MIN), (1150, 1150)]
+    pickups += [(int(cx[i]), int(cy[i])) for i in rng.integers(0, n, 5)]
+    pickups += list(zip(*full_range(rng, 5)))
+    for px, py in pickups:
+        px, py = int(px), int(py)
+        expected = _nearest_bulk(cx, cy, car_ids, slots.astype(np.int64), px, py)
+        assert index.nearest(cx, cy, car_ids, px, py, budget=1 << 62) == expected
+        # With the default budget the search may give up, but never be wrong
+        assert index.nearest(cx, cy, car_ids, px, py) in (None, expected)
+
+
+def test_nearest_after_remove():
+    rng = np.random.default_rng(0)
+    cx = rng.integers(-50, 50, 500).astype(np.int32)
+    cy = rng.integers(-50, 50, 500).astype(np.int32)
+    car_ids = np.arange(1, 501, dtype=np.int32)
+    index = ZOrderIndex()
+    index.insert(cx, cy, np.arange(500, dtype=np.int32))
+
+    free = np.ones(500, bool)
+    for _ in range(499):
+        expected = _nearest_bulk(cx, cy, car_ids, np.flatnonzero(free), 3, -7)
+        assert index.nearest(cx, cy, car_ids, 3, -7, budget=1 << 62) == expected
+        slot = expected[0]
+        index.remove(int(cx[slot]), int(cy[slot]), slot)
+        free[slot] = False
+
+
+def test_nearest_empty():
+    index = ZOrderIndex()
+    empty = np.empty(0, np.int32)
+    assert index.nearest(empty, empty, empty, 0, 0) == (-1, -1)
+
+
+def test_state_uses_index_from_threshold(monkeypatch):
+    # A square grid of one car per point, with room for one more car
+    side = int(np.ceil(np.sqrt(ZORDER_MIN_FREE_CARS)))
+    cars = [
+        Car(car_id=i + 1, name=str(i), location=Loc(1000 + i % side, 1000 + i // side))
+        for i in range(ZORDER_MIN_FREE_CARS)
+    ]
+    state = State(cars=cars)
+
+    def plain_scan(*args):
+        raise AssertionError("nearest car was not found through the z-order index")
+
+    monkeypatch.setattr(models, "_nearest_kernel", plain_scan)
+    book = state.book_car(Loc(1000 + side // 2, 1000 + side // 3), Loc(0, 0))
+    assert book.car_id == side // 3 * side + side // 2 + 1
+
+
+def test_state_keeps_index_only_for_large_fleets():
+    n = ZORDER_MIN_FREE_CARS
+    cars = [
+        Car(car_id=i + 1, name=str(i), location=Loc(i % 100, i // 100))
+        for i in range(n)
+    ]
+    state = State(cars=cars)
+    assert sorted(state._zindex.slots.tolist()) == list(range(n))
+
+    # The index is dropped below half of the threshold...
+    for _ in range(n - n // 2 + 1):
+        state.book_car(Loc(0, 0), Loc(0, 0))
+    assert state._zindex is None
+
+    # ...and rebuilt with every free car once the threshold is reached again
+    while len(state.list_cars(is_booked=True)):
+        state.increment_time()
+    assert sorted(state._zindex.slots.tolist()) == list(range(n))
+
+    state.reset()
+    assert state._zindex is None
+
+
+def test_zorder_keys_match_zorder():
+    rng = np.random.default_rng(0)
+    xs, ys = int32_boundary(rng, 100)
+    keys = zorder_keys(xs.astype(np.int32), ys.astype(np.int32))
+    assert keys.tolist() == [zorder(int(x), int(y)) for x, y in zip(xs, ys)]
+
+
+@pytest.mark.parametrize("x0, y0", [(-20, -20), (-3, 5), (0, 0), (INT32_MAX - 12, -6)])
+def test_bigmin_is_next_key_in_box(x0, y0):
+    rnd = random.Random(x0 * 31 + y0)
+    for _ in range(200):
+        x1 = min(x0 + rnd.randint(0, 12), INT32_MAX)
+        y1 = min(y0 + rnd.randint(0, 12), INT32_MAX)
+        zmin, zmax = zorder(x0, y0), zorder(x1, y1)
+        in_box = sorted(
+            zorder(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+        )
+        assert (in_box[0], in_box[-1]) == (zmin, zmax)
+
+        for _ in range(10):
+            x = rnd.randint(max(x0 - 40, INT32_MIN), min(x1 + 40, INT32_MAX))
+            y = rnd.randint(max(y0 - 40, INT32_MIN), min(y1 + 40, INT32_MAX))
+            zval = zorder(x, y)
+            if x0 <= x <= x1 and y0 <= y <= y1 or not zmin < zval < zmax:
+                continue
+            assert _bigmin(zval, zmin, zmax) == min(k for k in in_box if k > zval)
\ No newline at end of file